@@ -1,69 +1,436 @@
+# Requires the ffmpeg and ffprobe binaries on PATH
+import argparse
+import math
 import os
-from pytube import YouTube
-from moviepy.editor import VideoFileClip, concatenate_videoclips
+import re
+import struct
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+import yt_dlp
+from yt_dlp.extractor.youtube import YoutubeIE
+
+# Bounded suffix so long or pathological input can't make the regex backtrack
+YOUTUBE_URL_PATTERN = re.compile(r'https?://(?:(?:[\w-]+\.)?youtube\.com|youtu\.be)/[^\s]{1,2048}', re.ASCII)
+
+# Function to check that a URL points at YouTube
+def validate_youtube_url(url):
+    # Reject anything too long to be a real URL before running the regex
+    if len(url) > 2100:
+        return False
+    return bool(YOUTUBE_URL_PATTERN.fullmatch(url.strip()))
+
+# Function to get the YouTube video id a URL points to, so that every URL form
+# of the same video (youtu.be, watch?v=...&t=30, m.youtube.com, ...) maps to one key
+def get_video_id(url):
+    # Anything yt-dlp can't pull a video id from (e.g. a playlist) keys on the URL itself
+    return YoutubeIE.get_temp_id(url) or url
 
 # Function to download YouTube video
-def download_youtube_video(url, output_path='downloads'):
-    # Create the output directory if it doesn't exist
-    if not os.path.exists(output_path):
-        os.makedirs(output_path)
+def download_youtube_video(url, output_path='downloads', concurrent_fragments=8, fragmented_mp4=False):
+    # Create the output directory if it doesn't exist (batch mode can race here)
+    os.makedirs(output_path, exist_ok=True)
 
-    # Initialize YouTube object with the given URL
-    yt = YouTube(url)
+    # Pick the best video+audio pair rather than the pre-merged 'best' (capped at 720p),
+    # use player clients that don't apply n-sig throttling, and fetch DASH/HLS
+    # fragments in parallel (YouTube may start returning 403s much beyond 16)
+    ydl_opts = {
+        'format': 'bv*+ba/b',
+        # Merge into MP4 so the output can be written with +faststart
+        'merge_output_format': 'mp4',
+        'outtmpl': os.path.join(output_path, '%(title)s [%(id)s].%(ext)s'),
+        'extractor_args': {'youtube': {'player_client': ['ios', 'tv_embedded']}},
+        'concurrent_fragment_downloads': concurrent_fragments,
+        # Only fetch the video itself, even if the URL also names a playlist
+        'noplaylist': True,
+    }
 
-    # Get the highest resolution stream available
-    ### Not sure this actually works....
-    stream = yt.streams.get_highest_resolution()
+    # Merge into a fragmented MP4 instead, so the experimental sendfile path
+    # has moof+mdat fragments to repeat
+    if fragmented_mp4:
+        ydl_opts['postprocessor_args'] = {
+            'merger+ffmpeg_o': ['-movflags', '+frag_keyframe+empty_moov+default_base_moof'],
+        }
+
+    # Extract the video info once without resolving it any further, so a
+    # playlist is rejected before any of its entries are extracted
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=False, process=False)
+        if info.get('_type') in ('playlist', 'multi_video'):
+            raise ValueError(f"URL points to a playlist, not a single video: {url}")
+        print(f"Title: {info.get('title')} ({info.get('duration')}s)")
+
+        # Select the formats and download the video to the specified output path
+        info = ydl.process_ie_result(info, download=True)
+
+        # The merged video+audio file can have a different extension than
+        # prepare_filename() would give, so take the path yt-dlp actually wrote
+        if not info.get('requested_downloads'):
+            raise RuntimeError(f"yt-dlp did not download a file for: {url}")
+        download_path = info['requested_downloads'][0]['filepath']
 
-    # Download the video to the specified output path
-    download_path = stream.download(output_path)
-    
     # Return the path of the downloaded video file
     return download_path
 
-# Function to create a 10-hour version of the video
-def create_10_hour_version(video_path, output_path='output', duration_hours=10):
-    # Create the output directory if it doesn't exist
-    if not os.path.exists(output_path):
-        os.makedirs(output_path)
-    
-    # Load the downloaded video into a VideoFileClip object
-    clip = VideoFileClip(video_path)
+# Function to get the duration of a video in seconds using ffprobe
+def get_video_duration(video_path):
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-show_entries', 'format=duration',
+        '-of', 'default=noprint_wrappers=1:nokey=1',
+        video_path,
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return float(result.stdout.strip())
+
+# Function to walk the MP4 boxes stored in data[start:end]
+def iter_mp4_boxes(data, start, end):
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', data, offset)
+        if size == 1:
+            if offset + 16 > end:
+                return
+            size = struct.unpack_from('>Q', data, offset + 8)[0]
+        elif size == 0:
+            size = end - offset
+        if size < 8 or offset + size > end:
+            return
+        yield offset, size, box_type
+        offset += size
+
+# Function to find the header boxes and the byte range holding the moof+mdat fragments of a fragmented MP4
+def find_mp4_fragments(video_path):
+    header_boxes = []
+    fragments_start = None
+    fragments_end = None
+    with open(video_path, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        offset = 0
+
+        # Walk the top-level boxes: 32-bit size and 4-byte type, where size 1
+        # means a 64-bit size follows and size 0 means the box runs to the end
+        while offset + 8 <= file_size:
+            f.seek(offset)
+            size, box_type = struct.unpack('>I4s', f.read(8))
+            if size == 1:
+                # A truncated 64-bit size means the file isn't a usable MP4
+                largesize = f.read(8)
+                if len(largesize) < 8:
+                    return None
+                size = struct.unpack('>Q', largesize)[0]
+            elif size == 0:
+                size = file_size - offset
+            if size < 8:
+                return None
+
+            if box_type == b'moof' and fragments_start is None:
+                fragments_start = offset
+            if fragments_start is None and box_type != b'sidx':
+                # The segment index only covers a single loop, so it is left out
+                header_boxes.append((offset, size, box_type))
+            if box_type in (b'moof', b'mdat') and fragments_start is not None:
+                fragments_end = offset + size
+            offset += size
+
+    # Not a fragmented MP4, so there is nothing to repeat byte-for-byte
+    if fragments_start is None:
+        return None
+    return header_boxes, fragments_start, fragments_end
+
+# Function to read the header boxes of a fragmented MP4 for reuse in a longer video
+def read_mp4_header(video_path, header_boxes):
+    header = bytearray()
+    with open(video_path, 'rb') as f:
+        for offset, size, box_type in header_boxes:
+            f.seek(offset)
+            box = bytearray(f.read(size))
+
+            # moov/mvex/mehd holds the duration of a single loop, so turn it
+            # into a free box and let players work the duration out from the fragments
+            if box_type == b'moov':
+                for mvex_offset, mvex_size, mvex_type in iter_mp4_boxes(box, 8, len(box)):
+                    if mvex_type != b'mvex':
+                        continue
+                    mvex_end = mvex_offset + mvex_size
+                    for mehd_offset, mehd_size, mehd_type in iter_mp4_boxes(box, mvex_offset + 8, mvex_end):
+                        if mehd_type == b'mehd':
+                            box[mehd_offset + 4:mehd_offset + 8] = b'free'
+            header += box
+    return bytes(header)
+
+# Function to copy a byte range between files without going through Python
+def sendfile_all(out_fd, in_fd, offset, count):
+    while count > 0:
+        sent = os.sendfile(out_fd, in_fd, offset, count)
+        if sent == 0:
+            raise OSError(f"sendfile stopped with {count} bytes left")
+        offset += sent
+        count -= sent
+
+# Function to create an extended video by appending the fragments of a fragmented MP4
+def create_extended_video_sendfile(video_path, output_file, num_loops, fragments):
+    header_boxes, fragments_start, fragments_end = fragments
+    header = read_mp4_header(video_path, header_boxes)
 
-    # Initialize an empty list to hold the repeated clips
-    clips = []
+    # Write the ftyp+moov header once, then the moof+mdat fragments num_loops times.
+    # The repeated fragments keep their original sequence numbers and timestamps,
+    # so players that are strict about fragment order may reject the result
+    in_fd = os.open(video_path, os.O_RDONLY)
+    try:
+        with open(output_file, 'wb') as out:
+            out.write(header)
+            out.flush()
+            for i in range(num_loops):
+                sendfile_all(out.fileno(), in_fd, fragments_start, fragments_end - fragments_start)
+    finally:
+        os.close(in_fd)
 
-    # Initialize the duration in seconds of the concatenated clips
-    total_duration = 0
+    # Return the path of the extended video file
+    return output_file
+
+# Function to build the ffmpeg command that loops a video up to the target duration
+def build_ffmpeg_cmd(video_path, output_file, target_duration, copy=True):
+    cmd = [
+        'ffmpeg',
+        '-loglevel', 'error', '-nostats', '-progress', 'pipe:1',
+    ]
+    if not copy:
+        # Frame threading gives better decode throughput than slice threading
+        cmd += ['-thread_type', 'frame']
+    # -stream_loop already offsets the timestamps of each loop; +genpts only
+    # fills in presentation timestamps the input is missing
+    cmd += [
+        '-fflags', '+genpts',
+        '-stream_loop', '-1', '-i', os.path.abspath(video_path),
+        '-t', str(target_duration),
+    ]
+    if copy:
+        # Stream copy never decodes a frame, so threading flags would do nothing
+        cmd += ['-c', 'copy']
+    else:
+        # -threads 0 lets libx264 pick its own thread count (about 1.5x the
+        # logical cores), which is faster than pinning it to the core count
+        cmd += [
+            '-c:v', 'libx264', '-preset', 'veryfast',
+            '-threads', '0', '-x264-params', 'sliced-threads=0',
+            '-c:a', 'aac',
+        ]
+    # Move the moov atom to the front so players and uploads can start
+    # without reading the whole file first (ignored for the rare non-MP4
+    # download that didn't need merging)
+    cmd += ['-movflags', '+faststart', '-y', output_file]
+    return cmd
+
+# Function to run ffmpeg and print its progress towards the target duration
+def run_ffmpeg(cmd, target_duration, show_progress=True):
+    # ffmpeg writes key=value progress records to stdout, one per line;
+    # errors still go straight to the terminal through stderr
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=1024 * 1024, text=True)
+    for line in process.stdout:
+        # out_time_ms is in microseconds despite its name
+        if line.startswith('out_time_ms='):
+            value = line.split('=', 1)[1].strip()
+            if show_progress and value.isdigit():
+                progress = int(value) / 1_000_000 / target_duration * 100
+                print(f"\rProgress: {min(progress, 100):.1f}%", end='', flush=True)
+    if show_progress:
+        print()
 
-    # Repeat the video clip until the total duration reaches 10 hours (36000 seconds)
-    while total_duration < (duration_hours * 3600):
-        clips.append(clip)
-        total_duration += clip.duration
+    if process.wait() != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd)
+
+# Function to create a 10-hour version of the video
+def create_10_hour_version(video_path, output_path='output', duration_hours=10, show_progress=True,
+                           experimental_sendfile=False, encode_fallback=False):
+    # Create the output directory if it doesn't exist (batch mode can race here)
+    os.makedirs(output_path, exist_ok=True)
 
-    # Concatenate all the video clips into a single video
-    final_clip = concatenate_videoclips(clips)
+    # The target duration in seconds; ffmpeg stops looping once it is reached
+    target_duration = duration_hours * 3600
 
     # Create the output file path for the 10-hour video
-    output_file = os.path.join(output_path, f"10_hour_{os.path.basename(video_path)}")
+    output_file = os.fspath(Path(output_path) / f"10_hour_{Path(video_path).name}")
 
-    # Write the final concatenated video to the output file
-    final_clip.write_videofile(output_file, codec="libx264")
+    # Fragmented MP4s can be repeated by copying their fragments directly with sendfile,
+    # which only supports file-to-file copies on Linux
+    if experimental_sendfile:
+        fragments = find_mp4_fragments(video_path) if sys.platform.startswith('linux') else None
+        if fragments is not None:
+            try:
+                # Only this path needs the loop count, so only it pays for an ffprobe run
+                original_duration = get_video_duration(video_path)
+                if not original_duration > 0:
+                    raise ValueError(f"ffprobe reported a duration of {original_duration}s")
+                num_loops = math.ceil(target_duration / original_duration)
+                print(f"Appending fragments of {original_duration:.2f}s video {num_loops} times...")
+                return create_extended_video_sendfile(video_path, output_file, num_loops, fragments)
+            except (OSError, ValueError, subprocess.CalledProcessError) as e:
+                # Don't leave a partial output behind before retrying with ffmpeg
+                print(f"sendfile failed ({e}), falling back to ffmpeg")
+                try:
+                    os.remove(output_file)
+                except FileNotFoundError:
+                    pass
+        else:
+            print("Input is not a fragmented MP4 (or sendfile is unavailable), falling back to ffmpeg")
+
+    # Loop the input with stream copy and stop once the target duration is reached
+    print(f"Looping video until it reaches {target_duration}s...")
+    try:
+        run_ffmpeg(build_ffmpeg_cmd(video_path, output_file, target_duration, copy=True),
+                   target_duration, show_progress)
+    except subprocess.CalledProcessError:
+        if not encode_fallback:
+            raise
+        # Stream copy can fail on inputs whose streams can't be remuxed as-is.
+        # H.264/AAC can't go into the WebM/MKV containers yt-dlp usually
+        # merges into, so the re-encode is always written as an MP4
+        print("Stream copy failed, re-encoding instead...")
+        encoded_file = os.fspath(Path(output_file).with_suffix('.mp4'))
+        if encoded_file != output_file:
+            try:
+                os.remove(output_file)
+            except FileNotFoundError:
+                pass
+        run_ffmpeg(build_ffmpeg_cmd(video_path, encoded_file, target_duration, copy=False),
+                   target_duration, show_progress)
+        output_file = encoded_file
+
+    # Report the size of the output file with a single stat() call
+    try:
+        size = os.stat(output_file).st_size / 1e9
+        print(f"Output file size: {size:.2f} GB")
+    except FileNotFoundError:
+        pass
 
     # Return the path of the final 10-hour video file
     return output_file
 
+# Function to download and extend a batch of videos concurrently
+def create_10_hour_versions(urls, concurrent_fragments=8, experimental_sendfile=False, encode_fallback=False):
+    # Two URLs for the same video would download to and write the same files
+    # concurrently, so only keep the first URL for each video id
+    unique_urls = {}
+    for url in urls:
+        video_id = get_video_id(url)
+        if video_id in unique_urls:
+            print(f"Skipping {url}, same video as {unique_urls[video_id]}")
+        else:
+            unique_urls[video_id] = url
+    urls = list(unique_urls.values())
+
+    # Downloads are network-bound, so run several at once, but stay at 4 or
+    # fewer so YouTube doesn't rate-limit us
+    download_workers = max(1, min(4, len(urls)))
+
+    output_files = []
+    failed_urls = []
+    # Each ffmpeg run is disk-bound, so a single worker extends the videos one
+    # at a time while the downloads carry on
+    with ThreadPoolExecutor(max_workers=download_workers) as download_executor, \
+            ThreadPoolExecutor(max_workers=1) as extend_executor:
+        downloads = {
+            download_executor.submit(
+                download_youtube_video, url, concurrent_fragments=concurrent_fragments,
+                fragmented_mp4=experimental_sendfile,
+            ): url
+            for url in urls
+        }
+
+        # Start extending each video as soon as its download finishes, and
+        # skip any video that fails rather than failing the whole batch
+        extensions = {}
+        for future in as_completed(downloads):
+            url = downloads[future]
+            try:
+                downloaded_video_path = future.result()
+            except Exception as e:
+                print(f"Failed to download {url}: {e}")
+                failed_urls.append(url)
+                continue
+            print(f"Downloaded {url} to: {downloaded_video_path}")
+            extensions[extend_executor.submit(
+                create_10_hour_version, downloaded_video_path, show_progress=False,
+                experimental_sendfile=experimental_sendfile, encode_fallback=encode_fallback,
+            )] = (url, downloaded_video_path)
+
+        for future in as_completed(extensions):
+            url, downloaded_video_path = extensions[future]
+            try:
+                output_files.append(future.result())
+            except Exception as e:
+                print(f"Failed to create 10-hour video from {downloaded_video_path}: {e}")
+                failed_urls.append(url)
+                continue
+            print(f"10-hour video saved to: {output_files[-1]}")
+
+    # Return the paths of the 10-hour video files that were created and the URLs that failed
+    return output_files, failed_urls
+
+# Function to check the number of parallel fragment downloads given on the command line
+def concurrent_frags_count(value):
+    count = int(value)
+    # YouTube may start returning 403s much beyond 16
+    if not 1 <= count <= 16:
+        raise argparse.ArgumentTypeError(f"must be between 1 and 16, got {count}")
+    return count
+
+# Function to parse the command line arguments
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Create a 10-hour version of a YouTube video')
+    parser.add_argument('url', nargs='?', help='YouTube URL (prompted for if omitted)')
+    parser.add_argument('--urls-file', help='File with one YouTube URL per line to process as a batch')
+    parser.add_argument('-N', '--concurrent-frags', type=concurrent_frags_count, default=8,
+                        help='Number of fragments to download in parallel, 1-16 (default: 8)')
+    parser.add_argument('--experimental-sendfile', action='store_true',
+                        help='Merge the download into a fragmented MP4 and repeat its fragments with '
+                             'sendfile instead of ffmpeg (Linux only; videos that need no merging fall '
+                             'back to ffmpeg; some players reject the result)')
+    parser.add_argument('--encode-fallback', action='store_true',
+                        help='Re-encode with libx264 if the stream copy fails')
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    # Prompt the user to enter the YouTube URL
-    youtube_url = input("Please enter the YouTube URL: ")
+    args = parse_arguments()
+
+    # Process every URL in the file as a batch instead of a single video
+    if args.urls_file:
+        with open(args.urls_file) as f:
+            urls = [line.strip() for line in f if line.strip()]
+
+        # Skip anything that isn't a YouTube URL rather than failing mid-batch
+        valid_urls = []
+        for url in urls:
+            if validate_youtube_url(url):
+                valid_urls.append(url)
+            else:
+                print(f"Skipping invalid YouTube URL: {url}")
+        urls = valid_urls
+        output_files, failed_urls = create_10_hour_versions(urls, concurrent_fragments=args.concurrent_frags,
+                                                            experimental_sendfile=args.experimental_sendfile,
+                                                            encode_fallback=args.encode_fallback)
+
+        # Exit non-zero if any video in the batch failed
+        if failed_urls:
+            raise SystemExit(1)
+    else:
+        # Prompt the user to enter the YouTube URL if it wasn't given on the command line
+        youtube_url = (args.url or input("Please enter the YouTube URL: ")).strip()
+        if not validate_youtube_url(youtube_url):
+            raise SystemExit(f"Invalid YouTube URL: {youtube_url}")
     
-    # Download the YouTube video and get the path of the downloaded file
-    print(f"Downloading video from: {youtube_url}")
-    downloaded_video_path = download_youtube_video(youtube_url)
+        # Download the YouTube video and get the path of the downloaded file
+        print(f"Downloading video from: {youtube_url}")
+        downloaded_video_path = download_youtube_video(youtube_url, concurrent_fragments=args.concurrent_frags,
+                                                       fragmented_mp4=args.experimental_sendfile)
 
-    # Create a 10-hour version of the downloaded video
-    print(f"Creating 10-hour video...")
-    ten_hour_video_path = create_10_hour_version(downloaded_video_path)
+        # Create a 10-hour version of the downloaded video
+        print(f"Creating 10-hour video...")
+        ten_hour_video_path = create_10_hour_version(downloaded_video_path,
+                                                     experimental_sendfile=args.experimental_sendfile,
+                                                     encode_fallback=args.encode_fallback)
 
-    # Print the path of the final 10-hour video file
-    print(f"10-hour video saved to: {ten_hour_video_path}")
+        # Print the path of the final 10-hour video file
+        print(f"10-hour video saved to: {ten_hour_video_path}")